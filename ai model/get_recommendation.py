@@ -3,12 +3,14 @@ import numpy as np
 import tensorflow as tf
 import joblib
 import pickle
-from typing import List, Dict, Tuple, Any
+from scipy import sparse
+from typing import List, Dict, Tuple, Any, Optional
 import os
 import gzip
 import random
 
 from userinputs import get_user_preferences
+from precompute_recipe_labels import LIST_COLUMNS, add_text_columns, prepare_recipe_db, safe_eval
 
 # Substitutions dictionary
 SUBSTITUTIONS = {
@@ -22,6 +24,11 @@ SUBSTITUTIONS = {
     "cream": ["coconut cream", "cashew cream", "sour cream"],
     "vanilla extract": ["vanilla bean", "vanilla paste"],
 }
+# Normalized once so scoring never re-lowercases the table
+SUBSTITUTIONS_NORM = {
+    ingr.lower().strip(): frozenset(sub.lower().strip() for sub in subs)
+    for ingr, subs in SUBSTITUTIONS.items()
+}
 
 ALIASES = {
     "flour": ["all-purpose flour", "white flour", "whole wheat flour"],
@@ -37,7 +44,15 @@ ALIASES = {
 }
 
 SAMPLE_INGREDIENTS = ["yeast", "flour"]
-DEFAULT_INGREDIENTS = {"salt", "water", "oil", "pepper", "warm water", "salt and pepper", "salt pepper"}
+DEFAULT_INGREDIENTS = frozenset({"salt", "water", "oil", "pepper", "warm water", "salt and pepper", "salt pepper"})
+DEFAULT_SERVINGS = 4.0  # servings fed to the recipe model for every candidate
+MAX_INFER_BATCH = 256   # rows per model call; bigger batches only add latency on CPU
+MIN_INGREDIENT_SCORE = 0.15   # drop very weak matches
+MAX_CANDIDATES       = 1500   # hard cap sent to the model
+NUM_RESULTS          = 11     # top recipe + 10 other recommendations
+
+# (max minutes, label) pairs matching the time classifier's labels
+TIME_LABELS = ((15, "under_15"), (30, "under_30"), (60, "under_60"))
 
 # Dummy classes for development without model files
 class DummyInferenceFunction:
@@ -85,8 +100,8 @@ def get_dummy_recipe_db():
             'id': 'recipe1',
             'name': 'Pasta Carbonara',
             'ingredients': ['pasta', 'eggs', 'cheese', 'bacon'],
-            'ingredients_raw': str(['pasta', 'eggs', 'cheese', 'bacon']),
-            'steps': str(['Cook pasta', 'Mix eggs and cheese', 'Combine']),
+            'ingredients_raw': ['pasta', 'eggs', 'cheese', 'bacon'],
+            'steps': ['Cook pasta', 'Mix eggs and cheese', 'Combine'],
             'predicted_cuisine': 'italian',
             'predicted_time': 'under_30'
         },
@@ -94,8 +109,8 @@ def get_dummy_recipe_db():
             'id': 'recipe2',
             'name': 'Chicken Tacos',
             'ingredients': ['chicken', 'tortillas', 'onion', 'salsa'],
-            'ingredients_raw': str(['chicken', 'tortillas', 'onion', 'salsa']),
-            'steps': str(['Cook chicken', 'Warm tortillas', 'Assemble tacos']),
+            'ingredients_raw': ['chicken', 'tortillas', 'onion', 'salsa'],
+            'steps': ['Cook chicken', 'Warm tortillas', 'Assemble tacos'],
             'predicted_cuisine': 'mexican',
             'predicted_time': 'under_15'
         },
@@ -103,8 +118,8 @@ def get_dummy_recipe_db():
             'id': 'recipe3',
             'name': 'Chocolate Cake',
             'ingredients': ['flour', 'sugar', 'cocoa', 'butter', 'eggs'],
-            'ingredients_raw': str(['flour', 'sugar', 'cocoa', 'butter', 'eggs']),
-            'steps': str(['Mix dry ingredients', 'Add wet ingredients', 'Bake']),
+            'ingredients_raw': ['flour', 'sugar', 'cocoa', 'butter', 'eggs'],
+            'steps': ['Mix dry ingredients', 'Add wet ingredients', 'Bake'],
             'predicted_cuisine': 'american',
             'predicted_time': 'under_60'
         }
@@ -126,8 +141,8 @@ def get_dummy_recipe_db():
             'id': f'recipe{i}',
             'name': f'Recipe {i}',
             'ingredients': ingredients,
-            'ingredients_raw': str(ingredients),
-            'steps': str([f'Step 1 for recipe {i}', f'Step 2 for recipe {i}']),
+            'ingredients_raw': ingredients,
+            'steps': [f'Step 1 for recipe {i}', f'Step 2 for recipe {i}'],
             'predicted_cuisine': random.choice(['italian', 'mexican', 'chinese', 'indian', 'american']),
             'predicted_time': random.choice(['under_15', 'under_30', 'under_60'])
         })
@@ -135,12 +150,7 @@ def get_dummy_recipe_db():
     df = pd.DataFrame(sample_recipes)
     
     # Add necessary text columns
-    df['ingredients_raw_text'] = df['ingredients_raw'].apply(lambda x: " ".join(eval(x)))
-    df['ingredients_text'] = df['ingredients'].apply(lambda x: " ".join(x) if isinstance(x, list) else "")
-    df['steps_text'] = df['steps'].apply(lambda x: " ".join(eval(x)) if isinstance(x, str) else "")
-    df['full_text'] = df['ingredients_text'] + " " + df['ingredients_raw_text'] + " " + df['steps_text']
-    
-    return df
+    return add_text_columns(df)
 
 def expand_with_aliases(ingredient_set: set) -> set:
     expanded = set(ingredient_set)
@@ -151,20 +161,19 @@ def expand_with_aliases(ingredient_set: set) -> set:
                 expanded.update(alias_list)
     return expanded
 
-def ingredient_match_score(user_ingredients: List[str],
-                           recipe_ingredients: List[str],
+def normalize_ingredients(ingredients) -> frozenset:
+    return frozenset(i.lower().strip() for i in ingredients)
+
+def ingredient_match_score(user_explicit: frozenset,
+                           recipe_ingredients: frozenset,
                            substitutions_allowed: bool,
                            user_willing_to_buy_more: bool,
                            beta: float = 0.2) -> float:
-    user_explicit = set(i.lower().strip() for i in user_ingredients)
+    """Score one recipe; both ingredient sets must already be normalized."""
     augmented_user_set = user_explicit | DEFAULT_INGREDIENTS
-    recipe_non_default = {r.lower().strip() for r in recipe_ingredients if r.lower().strip() not in DEFAULT_INGREDIENTS}
 
     if not user_willing_to_buy_more:
-        if not recipe_non_default.issubset(user_explicit):
-            return 0.0
-        else:
-            return 1.0
+        return 1.0 if full_coverage(recipe_ingredients, user_explicit) else 0.0
 
     total = len(recipe_ingredients)
     if total == 0:
@@ -172,17 +181,14 @@ def ingredient_match_score(user_ingredients: List[str],
 
     matched = 0.0
     for ingr in recipe_ingredients:
-        ingr_norm = ingr.lower().strip()
-        if ingr_norm in augmented_user_set:
+        if ingr in augmented_user_set:
             matched += 1.0
-        elif substitutions_allowed and ingr_norm in SUBSTITUTIONS:
-            if any(sub.lower().strip() in augmented_user_set for sub in SUBSTITUTIONS[ingr_norm]):
-                matched += 0.5
+        elif substitutions_allowed and not SUBSTITUTIONS_NORM.get(ingr, frozenset()).isdisjoint(augmented_user_set):
+            matched += 0.5
 
     base_score = matched / total
     if user_explicit:
-        used_explicit = sum(1 for ingr in recipe_ingredients if ingr.lower().strip() in user_explicit)
-        bonus = used_explicit / len(user_explicit)
+        bonus = len(recipe_ingredients & user_explicit) / len(user_explicit)
     else:
         bonus = 0.0
     bonus_factor = 1 + beta * bonus
@@ -190,15 +196,169 @@ def ingredient_match_score(user_ingredients: List[str],
     final_score = base_score * bonus_factor
     return min(final_score, 1.0)
 
-def full_coverage(recipe_ingredients, user_explicit):
+def full_coverage(recipe_ingredients: frozenset, user_explicit: frozenset) -> bool:
     """Return True when every non‑default ingredient is already in the pantry."""
-    non_default = {i.lower().strip()
-                   for i in recipe_ingredients
-                   if i.lower().strip() not in DEFAULT_INGREDIENTS}
-    return non_default.issubset(user_explicit)
+    return (recipe_ingredients - DEFAULT_INGREDIENTS) <= user_explicit
+
+def recipe_ingredient_sets(recipe_db: pd.DataFrame):
+    """Yield the normalized ingredient set of each recipe.
+
+    The set merges 'ingredients' and 'ingredients_raw'.
+    """
+    for ingredients, raw in zip(recipe_db['ingredients'], recipe_db['ingredients_raw']):
+        yield normalize_ingredients(ingredients) | normalize_ingredients(raw)
+
+def finish_loading(recipe_db: pd.DataFrame) -> pd.DataFrame:
+    """Normalize the label columns after loading."""
+    recipe_db = recipe_db.reset_index(drop=True)
+    for col in ('predicted_cuisine', 'predicted_time'):
+        recipe_db[col] = recipe_db[col].astype(str).str.lower().astype('category')
+    return recipe_db
+
+def build_ingredient_matrix(ingr_sets) -> Tuple[Dict[str, int], sparse.csr_matrix]:
+    """Encode every recipe's ingredient set as a row of a sparse 0/1 matrix.
+
+    Returns the ingredient -> column vocabulary and the (recipes x vocab)
+    matrix, so per-recipe match counts become one sparse matrix product.
+    """
+    vocab = {}
+    indices = []
+    indptr = [0]
+    for ingr_set in ingr_sets:
+        indices.extend(vocab.setdefault(ingr, len(vocab)) for ingr in ingr_set)
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.float32)
+    matrix = sparse.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, len(vocab)))
+    return vocab, matrix
+
+def build_recipe_index(recipe_db: pd.DataFrame, le_recipe, steps_path: Optional[str] = None) -> Dict[str, Any]:
+    """Lookup structures derived from the loaded recipe database and encoder.
+
+    'groups' maps (predicted_cuisine, predicted_time) to the row positions of
+    the matching recipes, so filtering is a dict lookup instead of a scan;
+    'time_groups' and 'cuisine_groups' do the same by predicted_time and
+    predicted_cuisine alone.
+    'full_text' is the model's text input as a numpy array, and 'model_cols'
+    holds each recipe's column in the model's output (-1 when the label
+    encoder doesn't know the recipe), both aligned with the DB rows.
+    'vocab', 'ingr_matrix' and 'ingr_counts' encode each recipe's ingredients
+    for ingredient_hits; 'ingr_recipes' is the inverted (ingredient x recipes)
+    view of the same matrix used by recipes_using.
+    'steps_path' is the Parquet file to read steps from when recipe_db was
+    loaded without them.
+    """
+    groups = recipe_db.groupby(['predicted_cuisine', 'predicted_time'], observed=True).indices
+    time_groups = recipe_db.groupby('predicted_time', observed=True).indices
+    cuisine_groups = recipe_db.groupby('predicted_cuisine', observed=True).indices
+    class_to_col = {recipe_id: i for i, recipe_id in enumerate(le_recipe.classes_)}
+    model_cols = np.fromiter((class_to_col.get(recipe_id, -1) for recipe_id in recipe_db['id']),
+                             dtype=np.intp, count=len(recipe_db))
+    vocab, ingr_matrix = build_ingredient_matrix(recipe_ingredient_sets(recipe_db))
+    ingr_counts = np.diff(ingr_matrix.indptr).astype(np.float32)
+    return {"groups": groups, "time_groups": time_groups, "cuisine_groups": cuisine_groups,
+            "full_text": recipe_db['full_text'].to_numpy(copy=False),
+            "model_cols": model_cols,
+            "vocab": vocab, "ingr_matrix": ingr_matrix, "ingr_counts": ingr_counts,
+            "ingr_recipes": ingr_matrix.T.tocsr(), "steps_path": steps_path}
+
+def recipes_using(recipe_index: Dict[str, Any], ingredients) -> np.ndarray:
+    """Sorted row positions of the recipes that use any of the ingredients."""
+    vocab = recipe_index["vocab"]
+    ingr_recipes = recipe_index["ingr_recipes"]
+    cols = [vocab[i] for i in ingredients if i in vocab]
+    if not cols:
+        return np.empty(0, dtype=np.intp)
+    rows = [ingr_recipes.indices[ingr_recipes.indptr[c]:ingr_recipes.indptr[c + 1]] for c in cols]
+    return np.unique(np.concatenate(rows))
+
+def ingredient_hits(ingr_rows: sparse.csr_matrix,
+                    vocab: Dict[str, int],
+                    ingredient_groups: List[frozenset]) -> np.ndarray:
+    """Count, for each recipe row, its ingredients that fall in each group.
+
+    Returns an array of shape (n_rows, len(ingredient_groups)). Only the
+    groups' own columns are read, so the cost doesn't grow with the vocabulary.
+    """
+    hits = np.zeros((ingr_rows.shape[0], len(ingredient_groups)), dtype=np.float32)
+    for j, group in enumerate(ingredient_groups):
+        cols = [vocab[i] for i in group if i in vocab]
+        if cols:
+            hits[:, j] = np.asarray(ingr_rows[:, cols].sum(axis=1)).ravel()
+    return hits
+
+def substitutable_ingredients(augmented_user_set: frozenset) -> frozenset:
+    """Ingredients the user doesn't have but has a substitute for."""
+    return frozenset(
+        ingr for ingr, subs in SUBSTITUTIONS_NORM.items()
+        if not subs.isdisjoint(augmented_user_set)
+    ) - augmented_user_set
+
+def score_ingredient_hits(direct: np.ndarray,
+                          substituted: np.ndarray,
+                          used_explicit: np.ndarray,
+                          totals: np.ndarray,
+                          n_explicit: int,
+                          beta: float = 0.2) -> np.ndarray:
+    """Vectorized ingredient_match_score for users willing to buy more."""
+    matched = direct + 0.5 * substituted
+    base_score = np.divide(matched, totals, out=np.ones_like(matched), where=totals > 0)
+    bonus = used_explicit / n_explicit if n_explicit else 0.0
+    return np.minimum(base_score * (1 + beta * bonus), 1.0)
+
+def predict_model_scores(predict, texts: np.ndarray, model_cols: np.ndarray) -> np.ndarray:
+    """Run the recipe model over texts in chunks of MAX_INFER_BATCH rows.
+
+    Only each row's probability for its own recipe (model_cols, -1 when
+    unknown) is kept, so the full prediction matrix is never materialized.
+    """
+    n = len(texts)
+    scores = np.zeros(n, dtype=np.float32)
+    # assume DEFAULT_SERVINGS for every row in the candidate set
+    servings = np.full((min(n, MAX_INFER_BATCH), 1), DEFAULT_SERVINGS, dtype=np.float32)
+
+    for start in range(0, n, MAX_INFER_BATCH):
+        end = min(start + MAX_INFER_BATCH, n)
+        pred_matrix = predict(tf.constant(texts[start:end], dtype=tf.string),
+                              tf.constant(servings[:end - start])).numpy()
+
+        cols = model_cols[start:end]
+        found = cols >= 0                         # IDs known to the label encoder
+        chunk_scores = scores[start:end]
+        chunk_scores[found] = pred_matrix[np.flatnonzero(found), cols[found]]
+
+    return scores
 
+def time_label_for(max_time) -> Optional[str]:
+    """Map the user's maximum cooking time to a predicted_time label.
 
-def load_model_files():
+    Returns None when there is no time limit (e.g. "Any").
+    """
+    try:
+        minutes = int(max_time)
+    except (TypeError, ValueError):   # e.g. "Any"
+        return None
+    for limit, label in TIME_LABELS:
+        if minutes <= limit:
+            return label
+    return "over_60"
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, without a full sort."""
+    if k >= len(scores):
+        return np.argsort(-scores, kind='stable')
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx], kind='stable')]
+
+
+# Only the columns the recommender actually reads; everything else in the
+# recipe database is left on disk when loading from Parquet. 'steps' is
+# fetched per recommendation by load_recipe_steps.
+RECIPE_DB_COLUMNS = ["id", "name", "ingredients", "ingredients_raw",
+                     "full_text", "predicted_cuisine", "predicted_time"]
+
+
+def load_models():
+    """Load the recipe model and its label encoder."""
     models_dir = "."
     ai_models_dir = "ai model"
 
@@ -218,6 +378,27 @@ def load_model_files():
         le_recipe = pickle.load(f)
     print(f"Loaded label encoder with {len(le_recipe.classes_)} classes")
 
+    return make_predict_fn(infer), le_recipe
+
+
+def make_predict_fn(infer):
+    """Wrap the serving signature in a tf.function with a fixed input signature.
+
+    The batch dimension is left as None, so every candidate count reuses the
+    same trace instead of retracing per request.
+    """
+    @tf.function(input_signature=[tf.TensorSpec(shape=(None, 1), dtype=tf.string),
+                                  tf.TensorSpec(shape=(None, 1), dtype=tf.float32)])
+    def predict(full_text, servings):
+        return infer(full_text=full_text, servings=servings)["output_0"]
+
+    return predict
+
+
+def load_classifiers():
+    models_dir = "."
+    ai_models_dir = "ai model"
+
     cuisine_path = find_file(["cuisine_clf.joblib"], [models_dir, ai_models_dir])
     if not cuisine_path:
         raise FileNotFoundError("Cuisine classifier not found")
@@ -230,6 +411,30 @@ def load_model_files():
     time_clf = joblib.load(time_clf_path)
     print(f"Loaded time classifier")
 
+    return cuisine_clf, time_clf
+
+
+def load_recipe_db():
+    """Load the recipe database, preferring the precomputed Parquet file.
+
+    The Parquet file is written by precompute_recipe_labels.py. Without it the
+    raw pickle/CSV is annotated here instead, once per process.
+    Returns (recipe_db, parquet_path); parquet_path is None when the database
+    didn't come from Parquet and so already holds its steps.
+    """
+    models_dir = "."
+    ai_models_dir = "ai model"
+
+    parquet_path = find_file(["recipe_database.parquet"], [models_dir, ai_models_dir])
+    if parquet_path:
+        recipe_db = pd.read_parquet(parquet_path, columns=RECIPE_DB_COLUMNS)
+        # Parquet hands list columns back as numpy arrays
+        for col in LIST_COLUMNS:
+            if col in recipe_db:
+                recipe_db[col] = recipe_db[col].map(list)
+        print(f"Loaded recipe database from Parquet with {len(recipe_db)} recipes")
+        return finish_loading(recipe_db), parquet_path
+
     recipe_db_path = find_file(["recipe_database.pkl.gz"], [models_dir, ai_models_dir])
     print(f"🕵️ Attempting to load recipe database from: {recipe_db_path}")
 
@@ -244,7 +449,21 @@ def load_model_files():
         recipe_db = pd.read_csv(recipe_path)
         print(f"Loaded recipe database from CSV with {len(recipe_db)} recipes")
 
-    return infer, le_recipe, cuisine_clf, time_clf, recipe_db
+    print("No precomputed recipe labels found, annotating recipe database...")
+    cuisine_clf, time_clf = load_classifiers()
+    return finish_loading(prepare_recipe_db(recipe_db, cuisine_clf, time_clf)), None
+
+
+def load_recipe_steps(parquet_path, recipe_ids) -> Dict[Any, List[str]]:
+    """Read the steps of just the given recipes from the Parquet file."""
+    steps = pd.read_parquet(parquet_path, columns=["id", "steps"],
+                            filters=[("id", "in", list(recipe_ids))])
+    return {recipe_id: list(recipe_steps) for recipe_id, recipe_steps in zip(steps["id"], steps["steps"])}
+
+
+def load_model_files():
+    predict, le_recipe = load_models()
+    return (predict, le_recipe) + load_recipe_db()
 
 def find_file(filenames, directories):
     for directory in directories:
@@ -257,26 +476,20 @@ def find_file(filenames, directories):
 
 def process_recipe_batch(batch_df, user_ingredients, allow_substitutions, use_grocery):
     """Process a batch of recipes to calculate ingredient match scores"""
+    user_explicit = normalize_ingredients(user_ingredients)
     scores = []
     for _, recipe in batch_df.iterrows():
         # Get the ingredients list
         try:
-            ingr_list = recipe['ingredients']
-            if isinstance(ingr_list, str):
-                ingr_list = eval(ingr_list)
+            ingr_set = normalize_ingredients(safe_eval(recipe['ingredients']))
             
             # Try to get additional ingredients from 'ingredients_raw'
             try:
-                raw_ingr = recipe.get('ingredients_raw')
-                if isinstance(raw_ingr, str):
-                    raw_ingr = eval(raw_ingr)
-                if isinstance(raw_ingr, list):
-                    # Combine both lists and remove duplicates
-                    ingr_list = list(set(ingr_list) | set(raw_ingr))
+                ingr_set |= normalize_ingredients(safe_eval(recipe.get('ingredients_raw')))
             except Exception:
                 pass
             
-            score = ingredient_match_score(user_ingredients, ingr_list, allow_substitutions, use_grocery, beta=0.2)
+            score = ingredient_match_score(user_explicit, ingr_set, allow_substitutions, use_grocery, beta=0.2)
         except Exception as e:
             print(f"Error calculating score for recipe {recipe.get('id', 'unknown')}: {e}")
             score = 0.0
@@ -286,14 +499,9 @@ def process_recipe_batch(batch_df, user_ingredients, allow_substitutions, use_gr
     return scores
 
 
-def get_recommendations():
+def get_recommendations(predict, recipe_db, recipe_index, prefs):
     try:
-        infer, le_recipe, cuisine_clf, time_clf, recipe_db = load_model_files()
-
-        prefs = get_user_preferences()
         print(f"User preferences: {prefs}")
-        prefs["ingredients"] = SAMPLE_INGREDIENTS
-        print("Using sample ingredients:", prefs["ingredients"])
 
         selected_cuisine = prefs["cuisine"].lower()
         max_time = prefs.get("max_time", 60)
@@ -303,142 +511,102 @@ def get_recommendations():
 
         print(f"Looking for {selected_cuisine} recipes under {max_time} minutes")
 
-        recipe_db['ingredients'] = recipe_db['ingredients'].apply(lambda x: eval(x) if isinstance(x, str) else x if isinstance(x, list) else [])
-        recipe_db['ingredients_text'] = recipe_db['ingredients'].apply(lambda x: " ".join(x) if isinstance(x, list) else "")
-        recipe_db['steps_text'] = recipe_db['steps'].apply(lambda x: " ".join(eval(x)) if isinstance(x, str) else " ".join(x) if isinstance(x, list) else "")
-        recipe_db['full_text'] = recipe_db['ingredients_text'] + " " + recipe_db['steps_text']
-
-        print("Predicting cuisine...")
-        batch_size = 500
-        cuisines = []
-        for i in range(0, len(recipe_db), batch_size):
-            batch = recipe_db['ingredients_text'].iloc[i:i+batch_size].tolist()
-            predictions = cuisine_clf.predict(batch)
-            cuisines.extend(predictions)
-        recipe_db['predicted_cuisine'] = cuisines
-
-        print("Predicting cooking time...")
-        time_preds = time_clf.predict(recipe_db['name'].astype(str).tolist())
-        recipe_db['predicted_time'] = time_preds
-
-        if max_time <= 15:
-            time_label = "under_15"
-        elif max_time <= 30:
-            time_label = "under_30"
-        elif max_time <= 60:
-            time_label = "under_60"
-        else:
-            time_label = "over_60"
+        time_label = time_label_for(max_time)
 
-        if selected_cuisine != "any cuisine":
-            recipe_db = recipe_db[recipe_db['predicted_cuisine'].str.lower() == selected_cuisine]
-        recipe_db = recipe_db[recipe_db['predicted_time'] == time_label]
+        if time_label is None:
+            # No time limit
+            if selected_cuisine != "any cuisine":
+                positions = recipe_index["cuisine_groups"].get(selected_cuisine, [])
+            else:
+                positions = np.arange(len(recipe_db))
+        elif selected_cuisine != "any cuisine":
+            positions = recipe_index["groups"].get((selected_cuisine, time_label), [])
+        else:
+            positions = recipe_index["time_groups"].get(time_label, [])
+        positions = np.asarray(positions, dtype=np.intp)
 
-        print(f"Filtered to {len(recipe_db)} recipes for cuisine '{selected_cuisine}' and time '{time_label}'")
-        if recipe_db.empty:
+        print(f"Filtered to {len(positions)} recipes for cuisine '{selected_cuisine}' and time '{time_label or 'any'}'")
+        if positions.size == 0:
             print("No matching recipes found")
             return None, None
 
-
-        user_explicit = {i.lower().strip() for i in user_ingredients}
-        
-        scores = []
-        covers = []
-        for _, recipe in recipe_db.iterrows():
-            ingr_list = recipe['ingredients']
-            try:
-                raw_ingr = recipe.get('ingredients_raw')
-                if isinstance(raw_ingr, str):
-                    raw_ingr = eval(raw_ingr)
-                if isinstance(raw_ingr, list):
-                    ingr_list = list(set(ingr_list) | set(raw_ingr))
-            except Exception as e:
-                print(f"Error processing ingredients_raw for recipe {recipe['id']}: {e}")
-            score = ingredient_match_score(user_ingredients, ingr_list, allow_substitutions, use_grocery)
-            scores.append(score)
-            covers.append(full_coverage(ingr_list, user_explicit))
-        recipe_db['ingredient_score'] = scores
-        recipe_db['full_cover'] = covers
-
-
-        if not use_grocery:
-    # Try perfect matches first
-            candidate_recipes = recipe_db[recipe_db['full_cover']]
-            if candidate_recipes.empty:
-                print("No recipes use *only* your ingredients – "
-              "showing the best partial match instead.")
-                candidate_recipes = recipe_db        # fall back to everything
+        user_explicit = normalize_ingredients(user_ingredients)
+        augmented_user_set = user_explicit | DEFAULT_INGREDIENTS
+        substitutable = substitutable_ingredients(augmented_user_set) if allow_substitutions else frozenset()
+
+        # Only keep recipes that use at least one of the user's ingredients
+        # (or something they can substitute); in grocery mode keep everything
+        # when too few recipes are left to fill the recommendations
+        using_user = np.intersect1d(positions, recipes_using(recipe_index, user_explicit | substitutable),
+                                    assume_unique=True)
+        if using_user.size >= (NUM_RESULTS if use_grocery else 1):
+            positions = using_user
+            print(f"Narrowed to {len(positions)} recipes using your ingredients")
+
+        # Score on plain numpy arrays; only the final top rows become a DataFrame
+
+        totals = recipe_index["ingr_counts"][positions]
+        direct, substituted, used_explicit = ingredient_hits(
+            recipe_index["ingr_matrix"][positions], recipe_index["vocab"],
+            [augmented_user_set, substitutable, user_explicit]
+        ).T
+
+        # Every non-default ingredient is in the pantry
+        full_cover = direct == totals
+        if use_grocery:
+            ingredient_scores = score_ingredient_hits(direct, substituted, used_explicit,
+                                                      totals, len(user_explicit))
         else:
-            candidate_recipes = recipe_db
+            ingredient_scores = full_cover.astype(np.float32)
 
-        MIN_INGREDIENT_SCORE = 0.15   # drop very weak matches
-        MAX_CANDIDATES       = 1500   # hard cap sent to the model
-
-        if not use_grocery and candidate_recipes is recipe_db:
-            # we are already in "best partial match" mode
-            candidate_recipes = candidate_recipes[
-                candidate_recipes['ingredient_score'] >= MIN_INGREDIENT_SCORE
-            ]
+        if use_grocery:
+            candidates = np.arange(positions.size)
+        elif full_cover.any():
+            # Try perfect matches first
+            candidates = np.flatnonzero(full_cover)
+        else:
+            print("No recipes use *only* your ingredients – "
+                  "showing the best partial match instead.")
+            candidates = np.flatnonzero(ingredient_scores >= MIN_INGREDIENT_SCORE)
 
-        candidate_recipes = candidate_recipes.nlargest(
-            MAX_CANDIDATES, 'ingredient_score'
-        ).reset_index(drop=True)
+        candidates = candidates[top_k_indices(ingredient_scores[candidates], MAX_CANDIDATES)]
 
-        
         # ----------  bail‑out / soft‑fallback  ----------
-        if candidate_recipes.empty:
+        if candidates.size == 0:
             print("No recipes met the ingredient‑score threshold; "
                 "falling back to the 500 best‑scoring recipes overall.")
-            candidate_recipes = recipe_db.nlargest(
-                500, 'ingredient_score'
-            ).reset_index(drop=True)
+            candidates = top_k_indices(ingredient_scores, 500)
 
         # If it’s *still* empty, there’s nothing we can do.
-        if candidate_recipes.empty:
+        if candidates.size == 0:
             print("No suitable recipes found at all.")
             return None, None
 
-        print(f"→ Passing {len(candidate_recipes)} recipes to the model")
-        # ----------  model inference  ----------
-        X_text = candidate_recipes['full_text'].values
-        X_text_tensor = tf.constant(X_text.reshape(-1, 1), dtype=tf.string)
-
-        # assume 4 servings for every row in the candidate set
-        servings_tensor = tf.constant([[4.0]] * len(candidate_recipes), dtype=tf.float32)
-
-        inputs = {"full_text": X_text_tensor,
-                "servings":  servings_tensor}
+        candidate_rows = positions[candidates]
+        candidate_scores = ingredient_scores[candidates]
 
-        pred_matrix = infer(**inputs)["output_0"].numpy()
-
-        # ----------  attach model scores ----------
-        recipe_ids = le_recipe.classes_
-        candidate_recipes['model_score'] = 0.0   # initialise
-
-        for i, recipe_id in enumerate(candidate_recipes['id']):
-            idx = np.where(recipe_ids == recipe_id)[0]
-            if idx.size:                          # found this ID in the label encoder
-                candidate_recipes.loc[
-                    candidate_recipes['id'] == recipe_id, 'model_score'
-                ] = pred_matrix[i, idx[0]]
+        print(f"→ Passing {len(candidate_rows)} recipes to the model")
+        # ----------  model inference  ----------
+        texts = recipe_index["full_text"][candidate_rows].reshape(-1, 1)
+        model_scores = predict_model_scores(predict, texts, recipe_index["model_cols"][candidate_rows])
 
         # ----------  final ranking ----------
-        candidate_recipes['final_score'] = (
-            candidate_recipes['ingredient_score'] * 0.95 +
-            candidate_recipes['model_score']     * 0.05
-        )
+        final_scores = candidate_scores * 0.95 + model_scores * 0.05
+        top = top_k_indices(final_scores, NUM_RESULTS)
 
-        ranked_recipes = candidate_recipes.sort_values(
-            by='final_score', ascending=False
+        ranked_recipes = recipe_db.iloc[candidate_rows[top]].assign(
+            ingredient_score=candidate_scores[top],
+            model_score=model_scores[top],
+            final_score=final_scores[top],
         )
+        if 'steps' not in ranked_recipes:
+            # Loaded from Parquet without steps; fetch them for these rows only
+            steps = load_recipe_steps(recipe_index["steps_path"], ranked_recipes['id'])
+            ranked_recipes['steps'] = [steps.get(recipe_id, []) for recipe_id in ranked_recipes['id']]
 
-        if not ranked_recipes.empty:
-            top_recipe    = ranked_recipes.iloc[0]
-            other_recipes = ranked_recipes.iloc[1:11]   # next 10
-            return top_recipe, other_recipes
-        else:
-            print("No suitable recipes found")
-            return None, None
+        top_recipe    = ranked_recipes.iloc[0]
+        other_recipes = ranked_recipes.iloc[1:NUM_RESULTS]   # next 10
+        return top_recipe, other_recipes
 
 
     except Exception as e:
@@ -449,7 +617,11 @@ def get_recommendations():
 
 if __name__ == "__main__":
     print("Testing recipe recommendation system")
-    top_recipe, other_recipes = get_recommendations()
+    predict, le_recipe, recipe_db, parquet_path = load_model_files()
+    prefs = get_user_preferences()
+    prefs["ingredients"] = SAMPLE_INGREDIENTS
+    print("Using sample ingredients:", prefs["ingredients"])
+    top_recipe, other_recipes = get_recommendations(predict, recipe_db, build_recipe_index(recipe_db, le_recipe, parquet_path), prefs)
 
     if top_recipe is not None:
         print("\n--- TOP RECOMMENDATION ---")
@@ -457,7 +629,6 @@ if __name__ == "__main__":
         print(f"\nIngredients: {top_recipe['ingredients']}")
         print(f"\nIngredient match score: {top_recipe['ingredient_score']:.2f}")
         print(f"\nSteps: {top_recipe['steps']}")
-        print(f"\nServings: {top_recipe['servings']}")
 
         if len(other_recipes) > 0:
             print("\n--- OTHER RECOMMENDATIONS ---")
@@ -106,16 +106,33 @@ class FoodRecognizer:
         Returns:
             list[tuple]: Detected ingredient names with probabilities
         """
+        return self.recognize_batch([image], threshold, top_k)[0]
+    
+    def recognize_batch(self, images, threshold=None, top_k=None):
+        """
+        Recognize food ingredients from multiple images in one forward pass.
+        
+        Args:
+            images (list[PIL.Image]): List of input images
+            threshold (float): Confidence threshold for ingredient detection
+            top_k (int): Maximum number of ingredients to return
+            
+        Returns:
+            list[list[tuple]]: Detected ingredient names with probabilities for each image
+        """
         threshold = threshold if threshold is not None else THRESHOLD
         top_k = top_k if top_k is not None else TOP_K
         
+        if not images:
+            return []
+        
         # Create prompt templates for better CLIP performance
         texts = [f"a photo of {ingredient} food ingredient" for ingredient in self.ingredients]
         
-        # Process inputs
+        # Process inputs; the images are stacked into a single batch
         inputs = self.processor(
             text=texts,
-            images=image,
+            images=list(images),
             return_tensors="pt",
             padding=True
         ).to(self.device)
@@ -124,40 +141,23 @@ class FoodRecognizer:
         with torch.no_grad():
             outputs = self.model(**inputs)
         
-        # Get probabilities
+        # Get probabilities, one row per image
         logits_per_image = outputs.logits_per_image
-        probs = logits_per_image.softmax(dim=1).cpu().numpy()[0]
+        probs_per_image = logits_per_image.softmax(dim=1).cpu().numpy()
         
-        # Filter and sort results
-        detected_ingredients = []
-        for ingredient, prob in zip(self.ingredients, probs):
-            if prob >= threshold:
-                detected_ingredients.append((ingredient, float(prob)))
+        results = []
+        for probs in probs_per_image:
+            # Filter and sort results
+            detected_ingredients = []
+            for ingredient, prob in zip(self.ingredients, probs):
+                if prob >= threshold:
+                    detected_ingredients.append((ingredient, float(prob)))
 
-        detected_ingredients = sorted(detected_ingredients, 
-                                      key=lambda x: x[1], 
-                                      reverse=True)[:top_k]
-        
-        return detected_ingredients
-    
-    def recognize_batch(self, images, threshold=None, top_k=None):
-        """
-        Process multiple images in batch.
+            detected_ingredients = sorted(detected_ingredients, 
+                                          key=lambda x: x[1], 
+                                          reverse=True)[:top_k]
+            results.append(detected_ingredients)
         
-        Args:
-            images (list[PIL.Image]): List of input images
-            threshold (float): Confidence threshold for ingredient detection
-            top_k (int): Maximum number of ingredients to return
-            
-        Returns:
-            list[list[tuple]]: Detected ingredient names with probabilities for each image
-        """
-        threshold = threshold if threshold is not None else THRESHOLD
-        top_k = top_k if top_k is not None else TOP_K
-        
-        results = []
-        for image in images:
-            results.append(self.recognize(image, threshold, top_k))
         return results
 
     def get_ingredients_array(self, image_path, threshold=None, top_k=None):
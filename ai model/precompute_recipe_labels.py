@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+precompute_recipe_labels.py
+Annotate the recipe database once, offline, so the app doesn't have to on
+every recommendation request:
+    * list columns (ingredients, ingredients_raw, steps) parsed into real lists
+    * ingredients_text / ingredients_raw_text / full_text for the models
+    * predicted_cuisine / predicted_time from the pre-trained classifiers
+The result is written to recipe_database.parquet, which get_recommendation.py
+loads in preference to the raw pickle.
+"""
+
+from pathlib import Path
+from typing import List
+import ast
+import gzip
+import json
+import pickle
+import joblib
+
+import pandas as pd
+
+# ─────────────────────────────────── CONFIG ───────────────────────────────────
+PICKLE_PATH = Path("recipe_database.pkl.gz")           # output of train_model.py
+CSV_PATH = Path("ai model/recipes_ingredients.csv")    # raw Kaggle file, fallback
+PARQUET_PATH = Path("recipe_database.parquet")         # where to save the result
+CUISINE_MODEL_PATH = Path("cuisine_clf.joblib")
+TIME_MODEL_PATH = Path("time_tag_classifier.joblib")
+
+LIST_COLUMNS = ("ingredients", "ingredients_raw", "steps")
+BATCH_SIZE = 1000
+ROW_GROUP_SIZE = 10_000   # small row groups let id filters skip most of the file
+# ──────────────────────────────────────────────────────────────────────────────
+
+
+def safe_eval(obj) -> List[str]:
+    """Turn a *stringified* Python/JSON list into a real list.
+
+    * Silently handles NaN/None/float values by returning [].
+    * Tries literal_eval first, then a JSON fallback.
+    """
+    if obj is None or (isinstance(obj, float) and pd.isna(obj)):
+        return []
+    if isinstance(obj, list):
+        return obj
+    if hasattr(obj, "tolist"):  # numpy arrays coming back from Parquet
+        return obj.tolist()
+
+    text = str(obj)
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        pass
+
+    try:
+        json_text = text.replace("'", '"')
+        return json.loads(json_text)
+    except json.JSONDecodeError:
+        return []
+
+
+def predict_in_batches(model, texts: List[str]) -> List[str]:
+    predictions = []
+    for i in range(0, len(texts), BATCH_SIZE):
+        predictions.extend(model.predict(texts[i:i + BATCH_SIZE]))
+    return predictions
+
+
+def add_text_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Join the list columns into the text columns the models consume.
+
+    full_text is built the same way as the recipe model's training input
+    in train_model.py.
+    """
+    df["ingredients_text"] = df["ingredients"].apply(" ".join)
+    df["ingredients_raw_text"] = df["ingredients_raw"].apply(" ".join)
+    df["steps_text"] = df["steps"].apply(" ".join)
+    df["full_text"] = df["ingredients_text"] + " " + df["ingredients_raw_text"] + " " + df["steps_text"]
+    return df
+
+
+def prepare_recipe_db(df: pd.DataFrame, cuisine_clf, time_clf) -> pd.DataFrame:
+    """Add the parsed list columns, text columns and classifier labels."""
+    df = df.copy()
+    for col in LIST_COLUMNS:
+        df[col] = df[col].apply(safe_eval)
+    df = add_text_columns(df)
+
+    print("🍝  Predicting cuisine …")
+    df["predicted_cuisine"] = predict_in_batches(cuisine_clf, df["ingredients_text"].tolist())
+
+    print("⏱️   Predicting cooking time …")
+    df["predicted_time"] = predict_in_batches(time_clf, df["name"].astype(str).tolist())
+
+    return df
+
+
+def load_source() -> pd.DataFrame:
+    if PICKLE_PATH.exists():
+        print(f"📥  Loading {PICKLE_PATH} …")
+        with gzip.open(PICKLE_PATH, "rb") as f:
+            return pickle.load(f)
+    if CSV_PATH.exists():
+        print(f"📥  Loading {CSV_PATH} …")
+        return pd.read_csv(CSV_PATH)
+    raise FileNotFoundError(
+        f"Could not find {PICKLE_PATH} or {CSV_PATH}. Run train_model.py first."
+    )
+
+
+def main() -> None:
+    df = load_source()
+    print(f"🥘  Total recipes: {len(df):,}")
+
+    cuisine_clf = joblib.load(CUISINE_MODEL_PATH)
+    time_clf = joblib.load(TIME_MODEL_PATH)
+    df = prepare_recipe_db(df, cuisine_clf, time_clf)
+
+    # Sorted by id so per-row-group id statistics can prune lookups by id
+    df = df.sort_values("id")
+    df.to_parquet(PARQUET_PATH, index=False, compression="zstd", row_group_size=ROW_GROUP_SIZE)
+    print(f"\n✅  Recipe database saved to {PARQUET_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
+import ast
+import hashlib
+import io
 import streamlit as st
 from image_api import get_recipe_image
 from storage import save_favourites
 from PIL import Image
 import sys
 import os
-import tempfile
 
 # Add "ai model" directory to the path
 ai_model_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "ai model"))
@@ -18,7 +20,7 @@ print(f"Added to path: {image_recognition_path}")
 
 # Import user preferences and recommendation functions
 from userinputs import get_user_preferences
-from get_recommendation import get_recommendations
+from get_recommendation import get_recommendations, load_models, load_recipe_db, build_recipe_index
 
 # Import the FoodRecognizer class - with error handling for debugging
 try:
@@ -34,106 +36,114 @@ except ImportError as e:
         
         def recognize(self, image):
             return [("tomato", 0.9), ("onion", 0.8), ("garlic", 0.7)]
+        
+        def recognize_batch(self, images):
+            return [self.recognize(image) for image in images]
 
-# Initialize FoodRecognizer once
-try:
-    ingredients_csv = os.path.join(image_recognition_path, "data", "top_500_ingredients.csv")
-    print(f"Looking for ingredients CSV at: {ingredients_csv}")
-    
-    if os.path.exists(ingredients_csv):
-        print(f"Ingredients CSV found at: {ingredients_csv}")
-        recognizer = FoodRecognizer(ingredients_csv=ingredients_csv)
-    else:
+# Cache the heavy objects across Streamlit reruns
+@st.cache_resource
+def _get_recognizer():
+    try:
+        ingredients_csv = os.path.join(image_recognition_path, "data", "top_500_ingredients.csv")
+        print(f"Looking for ingredients CSV at: {ingredients_csv}")
+
+        if os.path.exists(ingredients_csv):
+            print(f"Ingredients CSV found at: {ingredients_csv}")
+            return FoodRecognizer(ingredients_csv=ingredients_csv)
         print(f"Ingredients CSV not found at: {ingredients_csv}")
-        recognizer = FoodRecognizer()  # Fall back to default path
-except Exception as e:
-    print(f"Error initializing FoodRecognizer: {e}")
-    recognizer = FoodRecognizer()  # Fall back to default initialization
+        return FoodRecognizer()  # Fall back to default path
+    except Exception as e:
+        print(f"Error initializing FoodRecognizer: {e}")
+        return FoodRecognizer()  # Fall back to default initialization
+
+@st.cache_resource
+def _get_models():
+    return load_models()
+
+@st.cache_resource
+def _get_recipe_db():
+    return load_recipe_db()   # (recipe_db, parquet_path)
+
+@st.cache_resource
+def _get_recipe_index():
+    _, le_recipe = _get_models()
+    recipe_db, parquet_path = _get_recipe_db()
+    return build_recipe_index(recipe_db, le_recipe, parquet_path)
+
+@st.cache_data(ttl=86400, max_entries=512)
+def _cached_recipe_image(name):
+    return get_recipe_image(name)
 
 def render_generator_tab():
     prefs = get_user_preferences()
+    recognizer = _get_recognizer()
+    predict, _ = _get_models()
     st.header("Upload Ingredients")
 
     # Initialize session states
     if "current_ingredients" not in st.session_state:
         st.session_state.current_ingredients = []
-    if "ingredient_processed" not in st.session_state:
-        st.session_state.ingredient_processed = False
+    if "detections" not in st.session_state:
+        st.session_state.detections = {}  # image hash -> recognizer output
     
     # Defaults
     combined_ingredients = []
-    use_substitutes = False
     
-    # Single file uploader
-    uploaded_file = st.file_uploader(
-        "Upload an image of your ingredient",
+    # Multi-file uploader
+    uploaded_files = st.file_uploader(
+        "Upload images of your ingredients",
         type=["jpg", "jpeg", "png"],
+        accept_multiple_files=True,
         key="ingredient_uploader"
     )
     
     # Status container
     status_container = st.empty()
     
-    # Process the uploaded image (only once per upload)
-    if uploaded_file and not st.session_state.ingredient_processed:
-        # Show progress message
-        status_container.info("Analyzing your ingredient...")
-        
-        # Save uploaded file to a temp file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            temp_path = tmp_file.name
-        
+    # Read each upload once per rerun
+    image_bytes = [uploaded_file.getvalue() for uploaded_file in uploaded_files or []]
+    image_keys = [hashlib.blake2b(data).hexdigest() for data in image_bytes]
+
+    if uploaded_files:
         try:
-            # Display the image
-            image = Image.open(temp_path).convert("RGB")
-            st.image(image, caption="Uploaded Image", use_container_width=True)
+            # Display the images
+            images = [Image.open(io.BytesIO(data)).convert("RGB") for data in image_bytes]
+            st.image(images, caption=[f.name for f in uploaded_files], use_container_width=True)
             
-            # Run image recognition once
-            try:
-                detected = recognizer.recognize(image)
-                # Get ingredient names and add to current ingredients
-                new_ingredients = [ingredient for ingredient, prob in detected]
-                # Add new ingredients without duplicates
-                for ingredient in new_ingredients:
-                    if ingredient not in st.session_state.current_ingredients:
-                        st.session_state.current_ingredients.append(ingredient)
-                
-                st.session_state.ingredient_processed = True
-                status_container.success(f"Detected: {', '.join(new_ingredients)}")
-                
-            except Exception as e:
-                print(f"Error with recognize method: {e}")
-                status_container.error(f"Error analyzing image: {e}")
+            # Recognize only images not analyzed yet, new images in one batch
+            pending = {key: image for key, image in zip(image_keys, images)
+                       if key not in st.session_state.detections}
+            if pending:
+                # Show progress message
+                status_container.info("Analyzing your ingredients...")
+                try:
+                    results = recognizer.recognize_batch(list(pending.values()))
+                    st.session_state.detections.update(zip(pending, results))
+                    # Get ingredient names from the new images only
+                    new_ingredients = list(dict.fromkeys(
+                        ingredient for key in pending
+                        for ingredient, prob in st.session_state.detections[key]
+                    ))
+                    # Add new ingredients without duplicates (dict keeps insertion order)
+                    st.session_state.current_ingredients = list(dict.fromkeys(
+                        st.session_state.current_ingredients + new_ingredients
+                    ))
+                    
+                    status_container.success(f"Detected: {', '.join(new_ingredients)}")
+                    
+                except Exception as e:
+                    print(f"Error with recognize method: {e}")
+                    status_container.error(f"Error analyzing image: {e}")
                 
         except Exception as e:
             status_container.error(f"Error processing image: {e}")
-        finally:
-            # Clean up temp file
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
-    elif uploaded_file and st.session_state.ingredient_processed:
-        # If already processed, just display the image
-        try:
-            image = Image.open(uploaded_file).convert("RGB")
-            st.image(image, caption="Uploaded Image", use_container_width=True)
-        except Exception as e:
-            pass
-    
-    # Reset button to allow processing a new image
-    if uploaded_file and st.session_state.ingredient_processed:
-        if st.button("Reset Image Analysis", key="reset_analysis"):
-            st.session_state.ingredient_processed = False
-            st.rerun()
     
     # Display and edit current ingredients
     if st.session_state.current_ingredients:
         st.subheader("Here's what I see:")
         
         # Simple display of ingredients without custom CSS
-        ingredients_to_remove = []
+        ingredients_to_remove = set()
         
         # Create a clean layout with multiple columns - without custom styling
         cols = st.columns(4)  # Use 4 columns for a compact layout
@@ -142,7 +152,7 @@ def render_generator_tab():
             with cols[i % 4]:
                 # Create a compact button with smaller text
                 if st.button(f"❌ {ingredient}", key=f"del_{i}", use_container_width=True):
-                    ingredients_to_remove.append(ingredient)
+                    ingredients_to_remove.add(ingredient)
         
         # Remove ingredients that were deleted
         if ingredients_to_remove:
@@ -160,16 +170,12 @@ def render_generator_tab():
                         if x.strip() and not x.strip().startswith("-")]
             
             # Process removals (with minus sign)
-            removals = [x.strip().lower()[1:] for x in new_ingredient.split(",") 
-                       if x.strip() and x.strip().startswith("-")]
+            removals = {x.strip().lower()[1:] for x in new_ingredient.split(",") 
+                        if x.strip() and x.strip().startswith("-")}
             
             # Update ingredients list
-            for ing in additions:
-                if ing and ing not in st.session_state.current_ingredients:
-                    st.session_state.current_ingredients.append(ing)
-            
             st.session_state.current_ingredients = [
-                ing for ing in st.session_state.current_ingredients 
+                ing for ing in dict.fromkeys(st.session_state.current_ingredients + additions)
                 if ing not in removals
             ]
             
@@ -189,16 +195,15 @@ def render_generator_tab():
     # Add pantry items if available
     if st.session_state.get("pantry"):
         if st.checkbox("Include items from my pantry", value=True):
-            for item in st.session_state.get("pantry", []):
-                if item not in combined_ingredients:
-                    combined_ingredients.append(item)
+            combined_ingredients += st.session_state.get("pantry", [])
     
     # Add grocery items if enabled in preferences
     if prefs.get("use_grocery", False) and st.session_state.get("grocery"):
         if st.checkbox("Include items from my grocery list", value=True):
-            for item in st.session_state.get("grocery", []):
-                if item not in combined_ingredients:
-                    combined_ingredients.append(item)
+            combined_ingredients += st.session_state.get("grocery", [])
+    
+    # Drop duplicates, keeping first-seen order
+    combined_ingredients = list(dict.fromkeys(combined_ingredients))
     
     # Display final ingredients
     if combined_ingredients:
@@ -213,22 +218,23 @@ def render_generator_tab():
             st.warning("Please upload an image and confirm your ingredients before generating.")
             return
 
-        # Update preferences with ingredients and substitute toggle
+        # Update preferences with ingredients; substitutions come from the
+        # preferences checkbox
         prefs["ingredients"] = combined_ingredients
-        prefs["allow_substitutions"] = use_substitutes
 
         # Show a loading spinner while getting recommendations
         with st.spinner("Finding the perfect recipe for you..."):
-            top_recipe, other_recs = get_recommendations()
+            recipe_db, _ = _get_recipe_db()
+            top_recipe, other_recs = get_recommendations(predict, recipe_db, _get_recipe_index(), prefs)
 
-        if not top_recipe:
+        if top_recipe is None:
             st.warning("No matching recipes found.")
         else:
             st.subheader(f"Top Recipe: {top_recipe['name']}")
             
             # Use your existing get_recipe_image function from image_api.py
             with st.spinner("Fetching recipe image..."):
-                img_url = get_recipe_image(top_recipe["name"])
+                img_url = _cached_recipe_image(top_recipe["name"])
             
             if img_url:
                 st.image(img_url, caption=top_recipe["name"], use_container_width=True)
@@ -239,7 +245,7 @@ def render_generator_tab():
             st.write("### Steps")
             try:
                 # First, try to safely evaluate the steps string into a list
-                steps = eval(top_recipe["steps"]) if isinstance(top_recipe["steps"], str) else top_recipe["steps"]
+                steps = ast.literal_eval(top_recipe["steps"]) if isinstance(top_recipe["steps"], str) else top_recipe["steps"]
                 
                 # Ensure steps is a list
                 if isinstance(steps, list):